@@ -17,6 +17,9 @@ import numpy as np
 EPS = 1e-9
 ANTENNA_MODEL_AZIMUTH_OFFSET_DEG = 90.0
 
+_GLOBAL_UP = np.array([0.0, 0.0, 1.0], dtype=float)
+_GLOBAL_UP.setflags(write=False)
+
 
 @dataclass
 class LegPlacement:
@@ -31,6 +34,27 @@ class LegPlacement:
     radial_offset: float
 
 
+class TrackingMigrator(ifcopenshell.util.schema.Migrator):
+    # Nested references are migrated through self.migrate as well, so every new entity passes through here.
+    def __init__(self) -> None:
+        super().__init__()
+        self.migrated_roots: list[ifcopenshell.entity_instance] = []
+        self.migrated_owner_histories: list[ifcopenshell.entity_instance] = []
+
+    def migrate(
+        self, element: ifcopenshell.entity_instance, new_file: ifcopenshell.file
+    ) -> ifcopenshell.entity_instance:
+        element_id = element.id()
+        is_new = element_id != 0 and element_id not in self.migrated_ids
+        new_element = super().migrate(element, new_file)
+        if is_new and element_id in self.migrated_ids:
+            if new_element.is_a("IfcRoot"):
+                self.migrated_roots.append(new_element)
+            elif new_element.is_a("IfcOwnerHistory"):
+                self.migrated_owner_histories.append(new_element)
+        return new_element
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Wstawia antene z pliku ANTENA.ifc na segment w pliku SEGMENT.ifc."
@@ -70,28 +94,25 @@ def normalize(vector: np.ndarray) -> np.ndarray:
     return vector / norm
 
 
-def read_polycurve_points(curve: ifcopenshell.entity_instance) -> list[np.ndarray]:
-    points: list[np.ndarray] = []
+def read_polycurve_points(curve: ifcopenshell.entity_instance) -> np.ndarray:
     if curve.is_a("IfcIndexedPolyCurve"):
-        for xyz in curve.Points.CoordList:
-            values = [float(v) for v in xyz]
-            if len(values) == 2:
-                values.append(0.0)
-            points.append(np.array(values, dtype=float))
+        coords = np.asarray(curve.Points.CoordList, dtype=np.float64)
     elif curve.is_a("IfcPolyline"):
-        for point in curve.Points:
-            coords = [float(v) for v in point.Coordinates]
-            if len(coords) == 2:
-                coords.append(0.0)
-            points.append(np.array(coords, dtype=float))
-    return points
+        coords = np.asarray([point.Coordinates for point in curve.Points], dtype=np.float64)
+    else:
+        return np.empty((0, 3), dtype=np.float64)
 
+    if coords.ndim != 2 or len(coords) == 0:
+        return np.empty((0, 3), dtype=np.float64)
+    if coords.shape[1] == 2:
+        # Pad 2D profiles into one preallocated contiguous (N, 3) block.
+        points = np.zeros((len(coords), 3), dtype=np.float64)
+        points[:, :2] = coords
+        return points
+    return np.ascontiguousarray(coords)
 
-def get_column_axis_points(column: ifcopenshell.entity_instance) -> tuple[np.ndarray, np.ndarray]:
-    if not column.IsTypedBy:
-        raise ValueError(f"Kolumna #{column.id()} nie ma przypisanego typu.")
 
-    column_type = column.IsTypedBy[0].RelatingType
+def get_type_axis_points(column_type: ifcopenshell.entity_instance) -> tuple[np.ndarray, np.ndarray] | None:
     for representation_map in column_type.RepresentationMaps or []:
         representation = representation_map.MappedRepresentation
         if representation.RepresentationIdentifier != "Axis":
@@ -103,15 +124,10 @@ def get_column_axis_points(column: ifcopenshell.entity_instance) -> tuple[np.nda
         if len(points) < 2:
             continue
         return points[0], points[-1]
+    return None
 
-    raise ValueError(f"Nie znaleziono osi dla kolumny #{column.id()}.")
-
-
-def get_column_profile_info(column: ifcopenshell.entity_instance) -> tuple[float, float]:
-    if not column.IsTypedBy:
-        return 0.0, 0.0
 
-    column_type = column.IsTypedBy[0].RelatingType
+def get_type_profile_info(column_type: ifcopenshell.entity_instance) -> tuple[float, float]:
     solid: ifcopenshell.entity_instance | None = None
     for representation_map in column_type.RepresentationMaps or []:
         representation = representation_map.MappedRepresentation
@@ -133,18 +149,28 @@ def get_column_profile_info(column: ifcopenshell.entity_instance) -> tuple[float
 
     if hasattr(profile, "OuterCurve") and profile.OuterCurve:
         outer_points = read_polycurve_points(profile.OuterCurve)
-        if outer_points:
-            outer_radius = max(float(np.linalg.norm(point[:2])) for point in outer_points)
+        if len(outer_points):
+            outer_radius = float(np.max(np.hypot(outer_points[:, 0], outer_points[:, 1])))
 
     inner_curves = getattr(profile, "InnerCurves", None) or []
     if inner_curves:
         first_inner_points = read_polycurve_points(inner_curves[0])
-        if first_inner_points:
-            inner_radius = max(float(np.linalg.norm(point[:2])) for point in first_inner_points)
+        if len(first_inner_points):
+            inner_radius = float(np.max(np.hypot(first_inner_points[:, 0], first_inner_points[:, 1])))
 
     return outer_radius, inner_radius
 
 
+def get_type_geometry(
+    column_type: ifcopenshell.entity_instance,
+) -> tuple[np.ndarray, np.ndarray, float, float] | None:
+    axis_points = get_type_axis_points(column_type)
+    if axis_points is None:
+        return None
+    outer_radius, inner_radius = get_type_profile_info(column_type)
+    return axis_points[0], axis_points[1], outer_radius, inner_radius
+
+
 def azimuth_to_world_x(azimuth_deg: float) -> np.ndarray:
     # 0 deg = +Y (north), positive clockwise. Model axes: +X east, +Y north.
     # Antenna geometry has an internal +90 deg orientation offset.
@@ -153,41 +179,76 @@ def azimuth_to_world_x(azimuth_deg: float) -> np.ndarray:
     return np.array([math.sin(azimuth_rad), math.cos(azimuth_rad), 0.0], dtype=float)
 
 
+def resolve_legs(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    target_height: float,
+    preferred_radial: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    deltas = ends - starts
+
+    sloped = np.abs(deltas[:, 2]) >= EPS
+    t = np.full(len(starts), -1.0)
+    t[sloped] = (target_height - starts[sloped, 2]) / deltas[sloped, 2]
+    hits = np.flatnonzero(sloped & (t >= 0.0) & (t <= 1.0))
+
+    deltas = deltas[hits]
+    lengths = np.sqrt(np.einsum("ij,ij->i", deltas, deltas))
+    directions = deltas / lengths[:, np.newaxis]
+    centers = starts[hits] + t[hits, np.newaxis] * deltas
+
+    # Build a horizontal vector orthogonal to the column axis.
+    # This keeps insertion at exact target Z while still respecting column inclination.
+    zeros = np.zeros(len(hits))
+    radials = np.stack([-directions[:, 1], directions[:, 0], zeros], axis=1)
+    vertical = np.sqrt(np.einsum("ij,ij->i", radials, radials)) < EPS
+    # Cross product with +X for columns that are exactly vertical.
+    radials[vertical] = np.stack([zeros[vertical], -directions[vertical, 2], directions[vertical, 1]], axis=1)
+    radials = radials / np.sqrt((radials * radials).sum(axis=1, keepdims=True))
+    radials[radials @ preferred_radial < 0.0] *= -1.0
+    return hits, centers, directions, radials
+
+
 def compute_leg_candidates(
     segment_model: ifcopenshell.file,
     target_height_model_units: float,
     preferred_radial_world: np.ndarray,
 ) -> list[LegPlacement]:
     candidates: list[LegPlacement] = []
-    global_up = np.array([0.0, 0.0, 1.0], dtype=float)
 
+    # Axis and profile are defined on the type, so resolve them once per column type instead of per column.
+    type_index: dict[int, tuple[np.ndarray, np.ndarray, float, float] | None] = {}
+    columns: list[ifcopenshell.entity_instance] = []
+    axis_starts: list[np.ndarray] = []
+    axis_ends: list[np.ndarray] = []
+    profile_radii: list[tuple[float, float]] = []
     for column in segment_model.by_type("IfcColumn"):
-        try:
-            axis_start, axis_end = get_column_axis_points(column)
-        except ValueError:
+        if not column.IsTypedBy:
             continue
-
-        delta = axis_end - axis_start
-        if abs(delta[2]) < EPS:
+        column_type = column.IsTypedBy[0].RelatingType
+        type_id = column_type.id()
+        if type_id not in type_index:
+            type_index[type_id] = get_type_geometry(column_type)
+        geometry = type_index[type_id]
+        if geometry is None:
             continue
 
-        t = (target_height_model_units - axis_start[2]) / delta[2]
-        if t < 0.0 or t > 1.0:
-            continue
+        axis_start, axis_end, outer_radius, inner_radius = geometry
+        columns.append(column)
+        axis_starts.append(axis_start)
+        axis_ends.append(axis_end)
+        profile_radii.append((outer_radius, inner_radius))
 
-        direction = normalize(delta)
-        center = axis_start + t * delta
+    if not columns:
+        raise ValueError("Nie znaleziono nogi segmentu (IfcColumn) przecinajacej zadana wysokosc.")
 
-        # Build a horizontal vector orthogonal to the column axis.
-        # This keeps insertion at exact target Z while still respecting column inclination.
-        radial_dir = np.array([-direction[1], direction[0], 0.0], dtype=float)
-        if np.linalg.norm(radial_dir) < EPS:
-            radial_dir = np.cross(np.array([1.0, 0.0, 0.0], dtype=float), direction)
-        radial_dir = normalize(radial_dir)
-        if np.dot(radial_dir, preferred_radial_world) < 0.0:
-            radial_dir = -radial_dir
+    starts = np.asarray(axis_starts, dtype=float)
+    ends = np.asarray(axis_ends, dtype=float)
+    hits, centers, directions, radials = resolve_legs(starts, ends, target_height_model_units, preferred_radial_world)
 
-        outer_radius, inner_radius = get_column_profile_info(column)
+    for row, column_index in enumerate(hits):
+        column = columns[column_index]
+        outer_radius, inner_radius = profile_radii[column_index]
         if outer_radius > 0.0 and inner_radius > 0.0 and inner_radius < outer_radius:
             radial_offset = (outer_radius + inner_radius) * 0.5
         elif outer_radius > 0.0:
@@ -195,17 +256,17 @@ def compute_leg_candidates(
         else:
             radial_offset = 0.0
 
-        insertion = center + radial_dir * radial_offset
+        insertion = centers[row] + radials[row] * radial_offset
         candidates.append(
             LegPlacement(
                 leg_id=column.id(),
                 leg_name=str(column.Name or "<NO_NAME>"),
-                axis_start=axis_start,
-                axis_end=axis_end,
-                center_at_height=center,
+                axis_start=axis_starts[column_index],
+                axis_end=axis_ends[column_index],
+                center_at_height=centers[row],
                 insertion_point=insertion,
-                direction=direction,
-                radial_direction=radial_dir,
+                direction=directions[row],
+                radial_direction=radials[row],
                 radial_offset=radial_offset,
             )
         )
@@ -217,22 +278,38 @@ def compute_leg_candidates(
 
 
 def find_source_antenna(antenna_model: ifcopenshell.file) -> ifcopenshell.entity_instance:
-    antennas = antenna_model.by_type("IfcCommunicationsAppliance")
+    antennas = antenna_model.by_type("IfcCommunicationsAppliance", include_subtypes=False)
     if not antennas:
         raise ValueError("W pliku z antena nie znaleziono IfcCommunicationsAppliance.")
 
     for antenna in antennas:
-        predefined = str(getattr(antenna, "PredefinedType", "") or "")
-        if predefined.upper() == "ANTENNA":
-            return antenna
+        # IFC enumeration values are already uppercase strings.
+        try:
+            if antenna.PredefinedType == "ANTENNA":
+                return antenna
+        except AttributeError:
+            continue
     return antennas[0]
 
 
 def first_owner_history(model: ifcopenshell.file) -> ifcopenshell.entity_instance | None:
-    histories = model.by_type("IfcOwnerHistory")
+    histories = model.by_type("IfcOwnerHistory", include_subtypes=False)
     return histories[0] if histories else None
 
 
+def invert_rigid_transform(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    rotation = matrix[:3, :3]
+    # a2p normalizes Axis and RefDirection but does not orthogonalize them, so a RefDirection that is not
+    # exactly perpendicular to Axis leaves a non-orthonormal block whose transpose is not its inverse.
+    if not np.allclose(matrix[3], (0.0, 0.0, 0.0, 1.0)) or not np.allclose(rotation.T @ rotation, np.eye(3)):
+        inverse = np.linalg.inv(matrix)
+        return inverse[:3, :3], inverse[:3, 3]
+
+    # Rotation + translation only, so the inverse rotation is the transpose.
+    rotation_inverse = rotation.T
+    return rotation_inverse, -rotation_inverse @ matrix[:3, 3]
+
+
 def create_axis_placement(
     model: ifcopenshell.file,
     reference_placement: ifcopenshell.entity_instance | None,
@@ -242,16 +319,15 @@ def create_axis_placement(
 ) -> ifcopenshell.entity_instance:
     if reference_placement:
         reference_matrix = ifcopenshell.util.placement.get_local_placement(reference_placement)
+        rotation_inverse, translation_inverse = invert_rigid_transform(reference_matrix)
+        point_local = rotation_inverse @ point_world + translation_inverse
+        x_local = normalize(rotation_inverse @ x_world)
+        z_local = normalize(rotation_inverse @ z_world)
     else:
-        reference_matrix = np.identity(4)
-
-    inverse_reference = np.linalg.inv(reference_matrix)
-    point_h = np.array([point_world[0], point_world[1], point_world[2], 1.0], dtype=float)
-    point_local = inverse_reference @ point_h
-
-    rotation_inverse = inverse_reference[:3, :3]
-    x_local = normalize(rotation_inverse @ x_world)
-    z_local = normalize(rotation_inverse @ z_world)
+        # No reference placement means identity: world coordinates are already local.
+        point_local = point_world
+        x_local = normalize(x_world)
+        z_local = normalize(z_world)
 
     if abs(float(np.dot(x_local, z_local))) > 0.999:
         raise ValueError("Wektory orientacji sa prawie rownolegle.")
@@ -268,8 +344,9 @@ def copy_inverse_relations(
     source_antenna: ifcopenshell.entity_instance,
     target_antenna: ifcopenshell.entity_instance,
     migrator: ifcopenshell.util.schema.Migrator,
+    owner_history: ifcopenshell.entity_instance | None = None,
 ) -> None:
-    owner_history = first_owner_history(target_model) or target_antenna.OwnerHistory
+    owner_history = owner_history or target_antenna.OwnerHistory
     migrated_type_cache: dict[int, ifcopenshell.entity_instance] = {}
 
     for relation in source_model.get_inverse(source_antenna):
@@ -328,20 +405,20 @@ def attach_to_container(
     model: ifcopenshell.file,
     container: ifcopenshell.entity_instance,
     product: ifcopenshell.entity_instance,
+    owner_history: ifcopenshell.entity_instance | None = None,
 ) -> None:
     if getattr(container, "ContainsElements", None):
         relation = container.ContainsElements[0]
-        current = list(relation.RelatedElements or [])
-        if product not in current:
-            current.append(product)
-            relation.RelatedElements = current
+        current = relation.RelatedElements or ()
+        product_id = product.id()
+        if product_id not in {element.id() for element in current}:
+            relation.RelatedElements = (*current, product)
         return
 
-    owner_history = first_owner_history(model) or product.OwnerHistory
     model.create_entity(
         "IfcRelContainedInSpatialStructure",
         GlobalId=ifcopenshell.guid.new(),
-        OwnerHistory=owner_history,
+        OwnerHistory=owner_history or product.OwnerHistory,
         Name=None,
         Description=None,
         RelatedElements=[product],
@@ -349,50 +426,38 @@ def attach_to_container(
     )
 
 
-def refresh_migrated_root_guids(target_model: ifcopenshell.file, migrator: ifcopenshell.util.schema.Migrator) -> None:
-    for target_id in migrator.migrated_ids.values():
-        entity = target_model.by_id(target_id)
-        if entity and entity.is_a("IfcRoot"):
-            entity.GlobalId = ifcopenshell.guid.new()
-
-
 def remove_if_orphan(model: ifcopenshell.file, entity: ifcopenshell.entity_instance | None) -> None:
     if not entity:
         return
-    if model.get_inverse(entity):
+    if model.get_total_inverses(entity):
         return
     model.remove(entity)
 
 
-def harmonize_migrated_owner_history(
+def finalize_migrated_entities(
     target_model: ifcopenshell.file,
-    migrator: ifcopenshell.util.schema.Migrator,
+    migrator: TrackingMigrator,
     target_owner_history: ifcopenshell.entity_instance | None,
 ) -> None:
+    # Single walk over migrated roots: fresh GlobalId and, if available, the target OwnerHistory.
+    migrated_owner_histories: set[ifcopenshell.entity_instance] = set(migrator.migrated_owner_histories)
+    for entity in migrator.migrated_roots:
+        entity.GlobalId = ifcopenshell.guid.new()
+        if not target_owner_history:
+            continue
+        owner_history = entity.OwnerHistory
+        if owner_history and owner_history != target_owner_history:
+            migrated_owner_histories.add(owner_history)
+        entity.OwnerHistory = target_owner_history
+
     if not target_owner_history:
         return
 
-    migrated_entities: list[ifcopenshell.entity_instance] = []
-    for target_id in migrator.migrated_ids.values():
-        entity = target_model.by_id(target_id)
-        if entity:
-            migrated_entities.append(entity)
-
-    migrated_owner_histories: set[ifcopenshell.entity_instance] = set()
-    for entity in migrated_entities:
-        if entity.is_a("IfcOwnerHistory"):
-            migrated_owner_histories.add(entity)
-        if entity.is_a("IfcRoot"):
-            owner_history = entity.OwnerHistory
-            if owner_history and owner_history != target_owner_history:
-                migrated_owner_histories.add(owner_history)
-            entity.OwnerHistory = target_owner_history
-
     # Remove migrated OwnerHistory objects that are no longer referenced, and their metadata if orphaned.
     for owner_history in migrated_owner_histories:
         if owner_history == target_owner_history:
             continue
-        if target_model.get_inverse(owner_history):
+        if target_model.get_total_inverses(owner_history):
             continue
 
         owning_application = owner_history.OwningApplication
@@ -422,20 +487,19 @@ def place_antenna_on_leg(
     target_container = leg.ContainedInStructure[0].RelatingStructure
 
     source_antenna = find_source_antenna(antenna_model)
-    migrator = ifcopenshell.util.schema.Migrator()
+    migrator = TrackingMigrator()
     target_antenna = migrator.migrate(source_antenna, segment_model)
 
     target_owner_history = first_owner_history(segment_model)
     if target_owner_history:
         target_antenna.OwnerHistory = target_owner_history
 
-    azimuth_z_world = np.array([0.0, 0.0, 1.0], dtype=float)
     axis_placement = create_axis_placement(
         model=segment_model,
         reference_placement=target_container.ObjectPlacement,
         point_world=leg_placement.insertion_point,
         x_world=azimuth_x_world,
-        z_world=azimuth_z_world,
+        z_world=_GLOBAL_UP,
     )
     target_antenna.ObjectPlacement = segment_model.createIfcLocalPlacement(target_container.ObjectPlacement, axis_placement)
 
@@ -445,10 +509,10 @@ def place_antenna_on_leg(
         source_antenna=source_antenna,
         target_antenna=target_antenna,
         migrator=migrator,
+        owner_history=target_owner_history,
     )
-    attach_to_container(segment_model, target_container, target_antenna)
-    refresh_migrated_root_guids(segment_model, migrator)
-    harmonize_migrated_owner_history(segment_model, migrator, target_owner_history)
+    attach_to_container(segment_model, target_container, target_antenna, owner_history=target_owner_history)
+    finalize_migrated_entities(segment_model, migrator, target_owner_history)
     target_antenna.GlobalId = ifcopenshell.guid.new()
     return target_antenna, target_container
 
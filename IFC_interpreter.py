@@ -1,19 +1,34 @@
 from __future__ import annotations
 
 import argparse
+import functools
+import os
 import sys
-from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Callable
 
 import ifcopenshell
 import ifcopenshell.validate as ifc_validate
 
 
+def is_ifc_name(name: str) -> bool:
+    # Same result as Path(name).suffix.lower() == ".ifc" (a bare ".ifc" has no suffix), lowering only the last 4 chars.
+    return len(name) > 4 and name[-4:].lower() == ".ifc"
+
+
 def find_ifc_files(directory: Path, recursive: bool = False) -> list[Path]:
-    if recursive:
-        files = [path for path in directory.rglob("*") if path.is_file() and path.suffix.lower() == ".ifc"]
-    else:
-        files = [path for path in directory.iterdir() if path.is_file() and path.suffix.lower() == ".ifc"]
+    # DirEntry carries the file type from readdir, so entries are classified without a stat() each.
+    files: list[Path] = []
+    pending = [directory]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        pending.append(entry.path)
+                elif is_ifc_name(entry.name) and entry.is_file():
+                    files.append(Path(entry.path))
     return sorted(files, key=lambda p: p.name.lower())
 
 
@@ -38,60 +53,91 @@ def format_issue(issue: dict) -> str:
     return f"{prefix} {message}"
 
 
-def write_report(path: Path, lines: list[str]) -> Path:
-    report_path = path.with_name(f"{path.stem}_VERIFICATION.txt")
-    report_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
-    return report_path
+def verification_report_path(path: Path) -> Path:
+    return path.with_name(f"{path.stem}_VERIFICATION.txt")
+
+
+def validate_ifc_file(path: Path, express_rules: bool, max_issues: int, echo: bool = True) -> tuple[int, Path]:
+    report_path = verification_report_path(path)
+    with report_path.open("w", encoding="utf-8", buffering=1 << 16) as report:
+
+        def emit(line: str) -> None:
+            if echo:
+                print(line)
+            report.write(line)
+            report.write("\n")
+
+        if echo:
+            print()
+        return validate_into_report(path, express_rules, max_issues, emit), report_path
 
 
-def validate_ifc_file(path: Path, express_rules: bool, max_issues: int) -> tuple[int, Path]:
-    report_lines: list[str] = [f"=== {path.name} ==="]
-    print(f"\n=== {path.name} ===")
+def validate_into_report(path: Path, express_rules: bool, max_issues: int, emit: Callable[[str], None]) -> int:
+    emit(f"=== {path.name} ===")
 
     try:
+        # Clear the C++ log and switch it to JSON, as ifc_validate.validate does when given a path,
+        # so parser messages from this single open still end up in the findings.
+        ifcopenshell.get_log()
+        ifcopenshell.ifcopenshell_wrapper.set_log_format_json()
         model = ifcopenshell.open(str(path))
         schema = getattr(model, "schema", "unknown")
         open_line = f"open: OK (schema={schema})"
-        print(open_line)
-        report_lines.append(open_line)
+        emit(open_line)
     except Exception as exc:
         fail_line = f"open: FAIL ({type(exc).__name__}: {exc})"
-        print(fail_line)
-        report_lines.append(fail_line)
-        return 1, write_report(path, report_lines)
+        emit(fail_line)
+        return 1
 
     logger = ifc_validate.json_logger()
     try:
-        ifc_validate.validate(str(path), logger, express_rules=express_rules)
+        logger.set_state("type", "schema")
+        ifc_validate.log_internal_cpp_errors(model, str(path), logger)
+        ifc_validate.validate(model, logger, express_rules=express_rules)
     except Exception as exc:
         fail_line = f"validate: FAIL ({type(exc).__name__}: {exc})"
-        print(fail_line)
-        report_lines.append(fail_line)
-        return 1, write_report(path, report_lines)
-
-    levels = Counter(str(item.get("level", "unknown")).lower() for item in logger.statements)
-    total_findings = sum(levels.values())
-    error_count = levels.get("error", 0)
-    warning_count = levels.get("warning", 0)
+        emit(fail_line)
+        return 1
+
+    error_count = warning_count = notice_count = 0
+    other_levels: dict[str, int] | None = None
+    head: list[dict] = []
+    for item in logger.statements:
+        level = str(item.get("level", "unknown")).lower()
+        if level == "error":
+            error_count += 1
+        elif level == "warning":
+            warning_count += 1
+        elif level == "notice":
+            notice_count += 1
+        else:
+            if other_levels is None:
+                other_levels = {}
+            other_levels[level] = other_levels.get(level, 0) + 1
+        if len(head) < max_issues:
+            head.append(item)
+    total_findings = len(logger.statements)
+
+    level_counts = (("error", error_count), ("warning", warning_count), ("notice", notice_count))
+    if other_levels:
+        level_counts += tuple(other_levels.items())
+    by_level = ", ".join(f"{level!r}: {count}" for level, count in level_counts if count)
 
     validate_line = (
         "validate: OK "
-        f"(findings={total_findings}, errors={error_count}, warnings={warning_count}, by_level={dict(levels)})"
+        f"(findings={total_findings}, errors={error_count}, warnings={warning_count}, by_level={{{by_level}}})"
     )
-    print(validate_line)
-    report_lines.append(validate_line)
+    emit(validate_line)
 
-    for issue in logger.statements[:max_issues]:
+    for issue in head:
         issue_line = f"- {format_issue(issue)}"
-        print(issue_line)
-        report_lines.append(issue_line)
+        emit(issue_line)
 
     if total_findings > max_issues:
         more_line = f"- ... and {total_findings - max_issues} more findings"
-        print(more_line)
-        report_lines.append(more_line)
+        emit(more_line)
 
-    return (1 if error_count > 0 else 0), write_report(path, report_lines)
+    return 1 if error_count > 0 else 0
 
 
 def parse_args() -> argparse.Namespace:
@@ -119,6 +165,12 @@ def parse_args() -> argparse.Namespace:
         default=10,
         help="Maksymalna liczba wypisanych problemow na plik.",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Liczba procesow walidujacych pliki rownolegle (domyslnie: liczba rdzeni CPU).",
+    )
     return parser.parse_args()
 
 
@@ -134,6 +186,10 @@ def main() -> int:
         print("Blad: --max-issues musi byc >= 1")
         return 2
 
+    if args.jobs < 1:
+        print("Blad: --jobs musi byc >= 1")
+        return 2
+
     ifc_files = find_ifc_files(directory, recursive=args.recursive)
     if not ifc_files:
         print(f"Nie znaleziono plikow IFC w folderze: {directory}")
@@ -144,10 +200,23 @@ def main() -> int:
 
     invalid_files = 0
     report_files: list[Path] = []
-    for ifc_file in ifc_files:
-        invalid, report_path = validate_ifc_file(ifc_file, args.express_rules, args.max_issues)
-        invalid_files += invalid
-        report_files.append(report_path)
+    if args.jobs > 1 and len(ifc_files) > 1:
+        # Workers only get paths (ifcopenshell objects are not picklable) and stay quiet;
+        # each report is printed here in file order once it is written.
+        validate = functools.partial(
+            validate_ifc_file, express_rules=args.express_rules, max_issues=args.max_issues, echo=False
+        )
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(ifc_files))) as executor:
+            for invalid, report_path in executor.map(validate, ifc_files, chunksize=1):
+                print()
+                print(report_path.read_text(encoding="utf-8"), end="")
+                invalid_files += invalid
+                report_files.append(report_path)
+    else:
+        for ifc_file in ifc_files:
+            invalid, report_path = validate_ifc_file(ifc_file, args.express_rules, args.max_issues)
+            invalid_files += invalid
+            report_files.append(report_path)
 
     print("\n=== PODSUMOWANIE ===")
     print(f"Sprawdzone pliki: {len(ifc_files)}")
@@ -1,27 +1,76 @@
 from __future__ import annotations
 
 import argparse
+import functools
+import heapq
+import json
+import mmap
+import operator
+import os
+import re
 import sys
-from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Callable, Iterable, Iterator, Sequence
 
 import ifcopenshell
+import ifcopenshell.ifcopenshell_wrapper
+
+NO_NAME = sys.intern("<NO_NAME>")
+UNNAMED_PROPERTY = sys.intern("<UNNAMED_PROPERTY>")
+# Large enough that a typical report is flushed in one or two writes.
+REPORT_BUFFER_SIZE = 256 * 1024
+COMBINED_REPORT_NAME = "_ALL_PROPERTYSETS.txt"
+# STEP ids are normally dense, so the scanner indexes plain lists by id. An id above DENSE_ID_MAX_RATIO times
+# the instances read so far (plus DENSE_ID_SLACK) means a sparse numbering the lists would waste memory on,
+# and the file is left to ifcopenshell.
+DENSE_ID_MAX_RATIO = 4
+DENSE_ID_SLACK = 1 << 16
+# Cache files are JSON whose "key" holds the format, engine, resolved source path and source size + mtime_ns;
+# bump the format when the cached layout changes.
+CACHE_FORMAT = "PSETC002"
+
+
+def _read_name_attribute(prop: object) -> object:
+    # Malformed HasProperties members (e.g. "((#6),#7)") come back as tuples rather than entities,
+    # so Name is read with a default and they are reported as <UNNAMED_PROPERTY>.
+    return getattr(prop, "Name", None)
+
+
+class StepScanError(Exception):
+    # Input the STEP scanner knowingly does not handle; the file is then read with ifcopenshell.open instead.
+    pass
 
 
 @dataclass
 class PsetStats:
     definition_count: int = 0
     assigned_items_count: int = 0
-    entity_type_counts: Counter[str] = field(default_factory=Counter)
+    entity_type_counts: dict[str, int] = field(default_factory=dict)
     property_names: set[str] = field(default_factory=set)
+    # Name values as read from the file; normalized once per distinct value by finalize_property_names.
+    raw_property_names: set[object] = field(default_factory=set)
+
+
+def is_ifc_name(name: str) -> bool:
+    # Same result as Path(name).suffix.lower() == ".ifc" (a bare ".ifc" has no suffix), lowering only the last 4 chars.
+    return len(name) > 4 and name[-4:].lower() == ".ifc"
 
 
 def find_ifc_files(directory: Path, recursive: bool = False) -> list[Path]:
-    if recursive:
-        files = [path for path in directory.rglob("*") if path.is_file() and path.suffix.lower() == ".ifc"]
-    else:
-        files = [path for path in directory.iterdir() if path.is_file() and path.suffix.lower() == ".ifc"]
+    # DirEntry carries the file type from readdir, so entries are classified without a stat() each.
+    files: list[Path] = []
+    pending = [directory]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        pending.append(entry.path)
+                elif is_ifc_name(entry.name) and entry.is_file():
+                    files.append(Path(entry.path))
     return sorted(files, key=lambda p: p.name.lower())
 
 
@@ -33,135 +82,524 @@ def get_or_create(stats_map: dict[str, PsetStats], pset_name: str) -> PsetStats:
     return existing
 
 
-def read_name(value: object, fallback: str = "<NO_NAME>") -> str:
+def read_name(value: object, fallback: str = NO_NAME) -> str:
+    # Interned so names repeated across psets share one object and set lookups hit the identity check.
     if value is None:
         return fallback
-    text = str(value).strip()
-    return text if text else fallback
+    # Name attributes are plain str (or None) in both engines, so str() is only needed for anything else.
+    text = value.strip() if type(value) is str else str(value).strip()
+    return sys.intern(text) if text else fallback
+
+
+def finalize_property_names(stats_by_name: dict[str, PsetStats]) -> None:
+    # Psets sharing a name mostly repeat the same property names, so read_name runs per distinct raw value
+    # rather than per property instance.
+    for stats in stats_by_name.values():
+        stats.property_names = {read_name(name, fallback=UNNAMED_PROPERTY) for name in stats.raw_property_names}
+        stats.raw_property_names = set()
 
 
-def collect_pset_stats(model: ifcopenshell.file) -> tuple[dict[str, PsetStats], int, set[int], set[int]]:
+def _inverse_attribute(declaration: ifcopenshell.ifcopenshell_wrapper.entity, entity_name: str) -> str | None:
+    for attribute in declaration.all_inverse_attributes():
+        if attribute.entity_reference().name() == entity_name:
+            return attribute.name()
+    return None
+
+
+def _no_relations(pset: ifcopenshell.entity_instance) -> tuple:
+    return ()
+
+
+@functools.lru_cache(maxsize=None)
+def inverse_readers(schema_identifier: str) -> tuple[Callable, Callable]:
+    # The inverse attribute names differ between schemas (PropertyDefinitionOf in IFC2X3, DefinesOccurrence later),
+    # so they are looked up once per schema and bound as attrgetters.
+    declaration = ifcopenshell.ifcopenshell_wrapper.schema_by_name(schema_identifier).declaration_by_name("IfcPropertySet")
+    readers = []
+    for entity_name in ("IfcRelDefinesByProperties", "IfcTypeObject"):
+        attribute_name = _inverse_attribute(declaration, entity_name)
+        readers.append(operator.attrgetter(attribute_name) if attribute_name else _no_relations)
+    return readers[0], readers[1]
+
+
+def collect_pset_stats(model: ifcopenshell.file) -> tuple[dict[str, PsetStats], int, int]:
     stats_by_name: dict[str, PsetStats] = {}
-    pset_id_to_name: dict[int, str] = {}
-    defined_ids: set[int] = set()
-    assigned_ids: set[int] = set()
+    pset_count = 0
+    unassigned_count = 0
+
+    # Assignments are read from the property set's own inverse attributes instead of scanning
+    # every IfcRelDefinesByProperties / IfcTypeObject.
+    occurrences_of, defines_type_of = inverse_readers(model.schema_identifier)
+
+    # Objects are usually assigned several property sets, so each one's class name is fetched once.
+    # Keyed by entity id: every instance shares the same Python wrapper class, so type(item) can't be used.
+    type_names: dict[int, str] = {}
 
+    # Attributes below are defined by the schema for every IfcPropertySet / IfcProperty /
+    # IfcRelDefinesByProperties, so they are read directly instead of through getattr with a default.
+    # Inverse attributes always come back as tuples; explicit aggregates may still be unset in invalid files.
     for pset in model.by_type("IfcPropertySet"):
-        pset_id = pset.id()
-        pset_name = read_name(getattr(pset, "Name", None))
-        pset_id_to_name[pset_id] = pset_name
-        defined_ids.add(pset_id)
+        pset_name = read_name(pset.Name)
+        pset_count += 1
+        # Each pset is visited once with all of its relations, so "assigned" is settled within this iteration.
+        assigned = False
 
         stats = get_or_create(stats_by_name, pset_name)
         stats.definition_count += 1
-
-        for prop in (getattr(pset, "HasProperties", None) or []):
-            prop_name = read_name(getattr(prop, "Name", None), fallback="<UNNAMED_PROPERTY>")
-            stats.property_names.add(prop_name)
-
-    for rel in model.by_type("IfcRelDefinesByProperties"):
-        definition = getattr(rel, "RelatingPropertyDefinition", None)
-        if not definition or not definition.is_a("IfcPropertySet"):
+        entity_type_counts = stats.entity_type_counts
+
+        stats.raw_property_names.update(map(_read_name_attribute, pset.HasProperties or ()))
+
+        for rel in occurrences_of(pset):
+            related = rel.RelatedObjects or ()
+            stats.assigned_items_count += len(related)
+            for item in related:
+                item_id = item.id()
+                entity_type = type_names.get(item_id)
+                if entity_type is None:
+                    entity_type = type_names[item_id] = item.is_a()
+                entity_type_counts[entity_type] = entity_type_counts.get(entity_type, 0) + 1
+            assigned = True
+
+        for type_obj in defines_type_of(pset):
+            stats.assigned_items_count += 1
+            type_obj_id = type_obj.id()
+            entity_type = type_names.get(type_obj_id)
+            if entity_type is None:
+                entity_type = type_names[type_obj_id] = type_obj.is_a()
+            entity_type_counts[entity_type] = entity_type_counts.get(entity_type, 0) + 1
+            assigned = True
+
+        if not assigned:
+            unassigned_count += 1
+
+    finalize_property_names(stats_by_name)
+    return stats_by_name, pset_count, unassigned_count
+
+
+_STEP_SCHEMA = re.compile(rb"FILE_SCHEMA\s*\(\s*\(\s*'([^']*)'")
+# One DATA instance: id, keyword and the raw argument list up to the closing ';' (quoted text may contain ';').
+# Written as unrolled loops without possessive quantifiers (Python 3.11+); a string only closes on a quote not
+# followed by another, so there is one way to match and a failed match does not backtrack exponentially.
+_STEP_INSTANCE = re.compile(
+    rb"#(\d+)\s*=\s*([A-Za-z0-9_]+)\s*\(([^';\x22]*(?:'[^']*(?:''[^']*)*'(?!')[^';\x22]*)*);"
+)
+_STEP_GAP = re.compile(rb"\s*(?:/\*.*?\*/\s*)*", re.DOTALL)
+_STEP_TOKEN = re.compile(
+    rb"'([^']*(?:''[^']*)*)'"  # string
+    rb"|#(\d+)"  # instance reference
+    rb"|[A-Za-z_][A-Za-z0-9_]*\s*(\()"  # typed value, e.g. IFCLABEL('...')
+    rb"|(\()"  # aggregate
+    rb"|(\))"
+    rb"|([^\s,()']+)"  # $, *, .ENUM., numbers
+)
+_STEP_STRING_ESCAPE = re.compile(
+    r"\\X2\\((?:[0-9A-Fa-f]{4})*)\\X0\\|\\X4\\((?:[0-9A-Fa-f]{8})*)\\X0\\|\\X\\([0-9A-Fa-f]{2})|\\S\\(.)|\\P.\\|\\\\",
+    re.DOTALL,
+)
+
+
+def decode_step_string(raw: bytes) -> str:
+    text = raw.replace(b"''", b"'").decode("utf-8", errors="replace")
+    if "\\" not in text:
+        return text
+    return _STEP_STRING_ESCAPE.sub(_decode_step_escape, text)
+
+
+def _decode_step_escape(match: re.Match[str]) -> str:
+    utf16, utf32, latin1, shifted = match.groups()
+    try:
+        if utf16 is not None:
+            return bytes.fromhex(utf16).decode("utf-16-be")
+        if utf32 is not None:
+            return bytes.fromhex(utf32).decode("utf-32-be")
+    except UnicodeDecodeError as exc:
+        raise StepScanError(f"Niepoprawny zapis znakow w tekscie STEP: {match.group(0)}") from exc
+    if latin1 is not None:
+        return chr(int(latin1, 16))
+    if shifted is not None:
+        return chr(ord(shifted) + 128)
+    return "" if match.group(0).startswith("\\P") else "\\"
+
+
+def parse_step_arguments(raw: bytes) -> list:
+    # Strings, references (int), aggregates and typed values (both as lists), None for $/*, other scalars as bytes.
+    stack: list[list] = [[]]
+    for match in _STEP_TOKEN.finditer(raw):
+        string, reference, typed, aggregate, closing, scalar = match.groups()
+        if string is not None:
+            stack[-1].append(decode_step_string(string))
+        elif reference is not None:
+            stack[-1].append(int(reference))
+        elif typed is not None or aggregate is not None:
+            nested: list = []
+            stack[-1].append(nested)
+            stack.append(nested)
+        elif closing is not None:
+            if len(stack) == 1:
+                raise StepScanError("Niezrownowazone nawiasy w argumentach STEP.")
+            stack.pop()
+        else:
+            stack[-1].append(None if scalar in (b"$", b"*") else scalar)
+    if len(stack) != 1:
+        raise StepScanError("Niezrownowazone nawiasy w argumentach STEP.")
+    return stack[0]
+
+
+def step_references(value: object) -> Iterator[int]:
+    # Instance ids in a parsed argument, including inside aggregates and typed values such as
+    # IFCPROPERTYSETDEFINITIONSET((#1,#2)); $ and plain scalars yield nothing.
+    if type(value) is int:
+        yield value
+    elif isinstance(value, list):
+        for item in value:
+            yield from step_references(item)
+
+
+def general_schema_name(schema_identifier: str) -> str:
+    # Same reduction as ifcopenshell.file.schema: IFC4X3_ADD2 -> IFC4X3, IFC2X3_TC1 -> IFC2X3.
+    match = re.match(r"IFC\d+(?:X\d+)?", schema_identifier.upper())
+    return match.group(0) if match else schema_identifier
+
+
+def _step_keywords(
+    schema: ifcopenshell.ifcopenshell_wrapper.schema_definition, ancestor: str, attribute_names: tuple[str, ...]
+) -> dict[bytes, tuple[int, ...]]:
+    # Upper-case STEP keyword of every subtype of `ancestor` -> positions of the requested attributes.
+    keywords: dict[bytes, tuple[int, ...]] = {}
+    for declaration in schema.entities():
+        supertype = declaration
+        while supertype is not None and supertype.name() != ancestor:
+            supertype = supertype.supertype()
+        if supertype is None:
             continue
+        indices = tuple(declaration.attribute_index(name) for name in attribute_names)
+        keywords[declaration.name().upper().encode()] = indices
+    return keywords
+
+
+def collect_pset_stats_step(ifc_path: Path) -> tuple[str, dict[str, PsetStats], int, int]:
+    # Reads only the instances the report needs straight from the STEP text, without building an ifcopenshell model.
+    # Unreadable or empty files, unknown schemas and malformed STEP raise StepScanError.
+    with ExitStack() as stack:
+        try:
+            handle = stack.enter_context(ifc_path.open("rb"))
+            data = stack.enter_context(mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError) as exc:
+            raise StepScanError(f"Nie mozna odczytac pliku: {exc}") from exc
+        schema_match = _STEP_SCHEMA.search(data)
+        if not schema_match:
+            raise StepScanError("Brak FILE_SCHEMA w naglowku pliku.")
+        schema_identifier = schema_match.group(1).decode("ascii", errors="replace")
+        try:
+            schema = ifcopenshell.ifcopenshell_wrapper.schema_by_name(schema_identifier)
+        except RuntimeError as exc:
+            # The wrapper reports unknown schemas with a plain RuntimeError.
+            raise StepScanError(f"Nieobslugiwany schemat: {schema_identifier}") from exc
+
+        class_names = {declaration.name().upper().encode(): declaration.name() for declaration in schema.entities()}
+        pset_keywords = _step_keywords(schema, "IfcPropertySet", ("Name", "HasProperties"))
+        property_keywords = _step_keywords(schema, "IfcProperty", ("Name",))
+        rel_keywords = _step_keywords(schema, "IfcRelDefinesByProperties", ("RelatedObjects", "RelatingPropertyDefinition"))
+        type_keywords = _step_keywords(schema, "IfcTypeObject", ("HasPropertySets",))
+
+        entity_classes: list[str | None] = []
+        psets: list[tuple[int, object, Sequence]] = []
+        property_names: dict[int, object] = {}
+        rels: list[tuple[Sequence, object]] = []
+        type_objects: list[tuple[str, Sequence]] = []
+
+        data_start = data.find(b"DATA;")
+        data_end = data.find(b"ENDSEC;", data_start)
+        if data_start < 0 or data_end < 0:
+            raise StepScanError("Brak sekcji DATA w pliku.")
+        position = data_start + len(b"DATA;")
+        instance_count = 0
+        for match in _STEP_INSTANCE.finditer(data, position, data_end):
+            # Anything between instances other than whitespace or comments is malformed: leave it to ifcopenshell.
+            if _STEP_GAP.match(data, position, match.start()).end() != match.start():
+                raise StepScanError(f"Niepoprawna skladnia STEP w bajcie {position}.")
+            position = match.end()
+            instance_count += 1
+            entity_id = int(match.group(1))
+            keyword = match.group(2).upper()
+            class_name = class_names.get(keyword)
+            if class_name is None:
+                continue
+            if entity_id >= len(entity_classes):
+                if entity_id > DENSE_ID_MAX_RATIO * instance_count + DENSE_ID_SLACK:
+                    raise StepScanError(f"Zbyt rzadka numeracja instancji STEP (#{entity_id}).")
+                entity_classes.extend([None] * (entity_id + 1 - len(entity_classes)))
+            entity_classes[entity_id] = class_name
+
+            indices = (
+                pset_keywords.get(keyword)
+                or property_keywords.get(keyword)
+                or rel_keywords.get(keyword)
+                or type_keywords.get(keyword)
+            )
+            if indices is None:
+                continue
 
-        pset_id = definition.id()
-        pset_name = pset_id_to_name.get(pset_id, read_name(getattr(definition, "Name", None)))
-        stats = get_or_create(stats_by_name, pset_name)
+            body = match.group(3).rstrip()
+            arguments = parse_step_arguments(body[:-1] if body.endswith(b")") else body)
+            values = [arguments[index] if index < len(arguments) else None for index in indices]
+            # Names must be plain strings or $ and references plain ids; typed or nested values are left
+            # to ifcopenshell rather than guessed at.
+            if keyword in property_keywords or keyword in pset_keywords:
+                if values[0] is not None and type(values[0]) is not str:
+                    raise StepScanError(f"Nieobslugiwana wartosc Name w #{entity_id}.")
+            if keyword in pset_keywords:
+                property_ids = values[1] if isinstance(values[1], list) else ()
+                if not all(type(property_id) is int for property_id in property_ids):
+                    raise StepScanError(f"Nieobslugiwana wartosc HasProperties w #{entity_id}.")
+                psets.append((entity_id, values[0], property_ids))
+            elif keyword in property_keywords:
+                property_names[entity_id] = values[0]
+            elif keyword in rel_keywords:
+                related = values[0] if isinstance(values[0], list) else ()
+                if not all(type(item_id) is int for item_id in related):
+                    raise StepScanError(f"Nieobslugiwana wartosc RelatedObjects w #{entity_id}.")
+                rels.append((related, values[1]))
+            else:
+                type_objects.append((class_name, values[0] if isinstance(values[0], list) else ()))
+        if _STEP_GAP.match(data, position, data_end).end() != data_end:
+            raise StepScanError(f"Niepoprawna skladnia STEP w bajcie {position}.")
 
-        related = getattr(rel, "RelatedObjects", None) or []
-        stats.assigned_items_count += len(related)
-        for item in related:
-            stats.entity_type_counts[item.is_a()] += 1
-        assigned_ids.add(pset_id)
+    stats_by_name: dict[str, PsetStats] = {}
+    # Indexed by entity id like entity_classes; None / 0 for ids that are not an IfcPropertySet.
+    pset_stats: list[PsetStats | None] = [None] * len(entity_classes)
+    assigned = bytearray(len(entity_classes))
 
-    for type_obj in model.by_type("IfcTypeObject"):
-        for definition in (getattr(type_obj, "HasPropertySets", None) or []):
-            if not definition or not definition.is_a("IfcPropertySet"):
+    for pset_id, name, property_ids in psets:
+        stats = get_or_create(stats_by_name, read_name(name))
+        stats.definition_count += 1
+        pset_stats[pset_id] = stats
+        raw_property_names_add = stats.raw_property_names.add
+        for property_id in property_ids:
+            if property_id in property_names:
+                raw_property_names_add(property_names[property_id])
+
+    # Only IfcPropertySet slots hold stats, so one index both filters other definitions (e.g. quantity sets)
+    # and finds the stats; $ or a reference past the last instance is skipped the same way.
+    id_count = len(entity_classes)
+    for related, definition in rels:
+        # IFC4 allows an IfcPropertySetDefinitionSet here, so the relation may define several psets at once;
+        # ifcopenshell lists it in DefinesOccurrence of each of them.
+        for pset_id in step_references(definition):
+            stats = pset_stats[pset_id] if pset_id < id_count else None
+            if stats is None:
+                continue
+            stats.assigned_items_count += len(related)
+            entity_type_counts = stats.entity_type_counts
+            for item_id in related:
+                entity_type = entity_classes[item_id] if item_id < id_count else None
+                if entity_type is not None:
+                    entity_type_counts[entity_type] = entity_type_counts.get(entity_type, 0) + 1
+            assigned[pset_id] = 1
+
+    for class_name, pset_ids in type_objects:
+        for pset_id in step_references(pset_ids):
+            stats = pset_stats[pset_id] if pset_id < id_count else None
+            if stats is None:
                 continue
-
-            pset_id = definition.id()
-            pset_name = pset_id_to_name.get(pset_id, read_name(getattr(definition, "Name", None)))
-            stats = get_or_create(stats_by_name, pset_name)
-
             stats.assigned_items_count += 1
-            stats.entity_type_counts[type_obj.is_a()] += 1
-            assigned_ids.add(pset_id)
+            stats.entity_type_counts[class_name] = stats.entity_type_counts.get(class_name, 0) + 1
+            assigned[pset_id] = 1
 
-    return stats_by_name, len(defined_ids), assigned_ids, defined_ids
+    unassigned_count = len(psets) - assigned.count(1)
+    finalize_property_names(stats_by_name)
+    return general_schema_name(schema_identifier), stats_by_name, len(psets), unassigned_count
 
 
-def render_report(file_name: str, schema: str, stats_by_name: dict[str, PsetStats], pset_count: int, unassigned_count: int, max_properties: int) -> list[str]:
-    lines: list[str] = []
-    lines.append(f"FILE: {file_name}")
-    lines.append(f"SCHEMA: {schema}")
-    lines.append(f"IFCPROPERTYSET_INSTANCES: {pset_count}")
-    lines.append(f"UNIQUE_PROPERTYSET_NAMES: {len(stats_by_name)}")
-    lines.append(f"UNASSIGNED_IFCPROPERTYSET_INSTANCES: {unassigned_count}")
-    lines.append("")
-    lines.append("PROPERTY_SETS:")
+def render_report(file_name: str, schema: str, stats_by_name: dict[str, PsetStats], pset_count: int, unassigned_count: int, max_properties: int, max_entity_types: int | None = None) -> Iterator[str]:
+    yield f"FILE: {file_name}"
+    yield f"SCHEMA: {schema}"
+    yield f"IFCPROPERTYSET_INSTANCES: {pset_count}"
+    yield f"UNIQUE_PROPERTYSET_NAMES: {len(stats_by_name)}"
+    yield f"UNASSIGNED_IFCPROPERTYSET_INSTANCES: {unassigned_count}"
+    yield ""
+    yield "PROPERTY_SETS:"
 
     if not stats_by_name:
-        lines.append("none")
-        return lines
-
-    ordered = sorted(stats_by_name.items(), key=lambda item: item[0].casefold())
-    for index, (pset_name, stats) in enumerate(ordered, start=1):
-        lines.append(f"{index}. {pset_name}")
-        lines.append(f"   definitions: {stats.definition_count}")
-        lines.append(f"   assigned_items: {stats.assigned_items_count}")
-
-        if stats.entity_type_counts:
-            entity_parts = [
-                f"{name}:{count}"
-                for name, count in sorted(stats.entity_type_counts.items(), key=lambda item: (-item[1], item[0]))
-            ]
-            lines.append(f"   entity_types: {', '.join(entity_parts)}")
+        yield "none"
+        return
+
+    # Decorate once with the casefolded name; (key, name) pairs then sort with plain tuple comparison.
+    ordered = [(pset_name.casefold(), pset_name) for pset_name in stats_by_name]
+    ordered.sort()
+    # One multi-line string per pset: write_report appends the final newline to each yielded item.
+    for index, (_, pset_name) in enumerate(ordered, start=1):
+        stats = stats_by_name[pset_name]
+
+        entity_type_counts = stats.entity_type_counts
+        if entity_type_counts:
+            # (-count, name) tuples order by count descending, then name, with plain tuple comparison.
+            ranked = [(-count, name) for name, count in entity_type_counts.items()]
+            if max_entity_types is not None and len(ranked) > max_entity_types:
+                ranked = heapq.nsmallest(max_entity_types, ranked)
+            else:
+                ranked.sort()
+            entity_types = ", ".join(f"{name}:{-negated}" for negated, name in ranked)
+            if len(entity_type_counts) > len(ranked):
+                entity_types = f"{entity_types} ... (+{len(entity_type_counts) - len(ranked)} more)"
         else:
-            lines.append("   entity_types: none")
+            entity_types = "none"
 
         property_names = sorted(stats.property_names, key=str.casefold)
         if property_names:
-            displayed = property_names[:max_properties]
-            suffix = ""
+            properties = ", ".join(property_names[:max_properties])
             if len(property_names) > max_properties:
-                suffix = f" ... (+{len(property_names) - max_properties} more)"
-            lines.append(f"   properties({len(property_names)}): {', '.join(displayed)}{suffix}")
+                properties = f"{properties} ... (+{len(property_names) - max_properties} more)"
         else:
-            lines.append("   properties(0): none")
-
-    return lines
-
+            properties = "none"
+
+        yield (
+            f"{index}. {pset_name}\n"
+            f"   definitions: {stats.definition_count}\n"
+            f"   assigned_items: {stats.assigned_items_count}\n"
+            f"   entity_types: {entity_types}\n"
+            f"   properties({len(property_names)}): {properties}"
+        )
 
-def write_report(report_path: Path, lines: list[str]) -> None:
-    report_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
 
+def write_report(report_path: Path, lines: Iterable[str]) -> None:
+    with report_path.open("w", encoding="utf-8", buffering=REPORT_BUFFER_SIZE) as report:
+        report.writelines(f"{line}\n" for line in lines)
 
-def build_report_for_file(ifc_path: Path, max_properties: int, output_dir: Path) -> tuple[bool, Path]:
-    report_path = output_dir / f"{ifc_path.stem}_PROPERTYSETS.txt"
 
+# Stats are cached as JSON rather than pickle: loading a pickle from the output directory would run whatever
+# code anyone able to write there put in it. Property name sets are stored as lists.
+def load_cached_stats(cache_path: Path, cache_key: dict[str, object]) -> tuple[str, dict[str, PsetStats], int, int] | None:
     try:
-        model = ifcopenshell.open(str(ifc_path))
-    except Exception as exc:
-        write_report(
-            report_path,
+        with cache_path.open("r", encoding="utf-8") as cache:
+            cached = json.load(cache)
+        if cached["key"] != cache_key:
+            return None
+        stats_by_name = {
+            pset_name: PsetStats(definition_count, assigned_items_count, entity_type_counts, set(property_names))
+            for pset_name, definition_count, assigned_items_count, entity_type_counts, property_names in cached["psets"]
+        }
+        return cached["schema"], stats_by_name, cached["pset_count"], cached["unassigned_count"]
+    except (OSError, ValueError, KeyError, TypeError):
+        # Missing, stale or unreadable cache: the stats are simply collected again.
+        return None
+
+
+def store_cached_stats(
+    cache_path: Path, cache_key: dict[str, object], result: tuple[str, dict[str, PsetStats], int, int]
+) -> None:
+    schema, stats_by_name, pset_count, unassigned_count = result
+    cached = {
+        "key": cache_key,
+        "schema": schema,
+        "pset_count": pset_count,
+        "unassigned_count": unassigned_count,
+        "psets": [
             [
+                pset_name,
+                stats.definition_count,
+                stats.assigned_items_count,
+                stats.entity_type_counts,
+                sorted(stats.property_names),
+            ]
+            for pset_name, stats in stats_by_name.items()
+        ],
+    }
+    try:
+        with cache_path.open("w", encoding="utf-8") as cache:
+            json.dump(cached, cache, separators=(",", ":"))
+    except OSError:
+        pass
+
+
+def report_lines_for_file(
+    ifc_path: Path,
+    max_properties: int,
+    engine: str = "ifcopenshell",
+    max_entity_types: int | None = None,
+    cache_dir: Path | None = None,
+) -> tuple[bool, Iterable[str]]:
+    result = None
+    cache_path = cache_key = None
+    if cache_dir is not None:
+        try:
+            source = ifc_path.stat()
+        except OSError:
+            pass
+        else:
+            cache_path = cache_dir / f"{ifc_path.stem}.psetcache"
+            # Keyed by engine too: the step scanner and ifcopenshell are separate readers of the same file.
+            # The path tells apart same-named files from different folders (--recursive), which share a cache file.
+            cache_key = {
+                "format": CACHE_FORMAT,
+                "engine": engine,
+                "path": str(ifc_path.resolve()),
+                "size": source.st_size,
+                "mtime_ns": source.st_mtime_ns,
+            }
+            result = load_cached_stats(cache_path, cache_key)
+    cached = result is not None
+
+    if result is None and engine == "step":
+        try:
+            result = collect_pset_stats_step(ifc_path)
+        except StepScanError:
+            # Input the scanner does not handle goes through ifcopenshell, which also words the open errors.
+            result = None
+
+    if result is None:
+        try:
+            model = ifcopenshell.open(str(ifc_path))
+        except Exception as exc:
+            return False, [
                 f"FILE: {ifc_path.name}",
                 f"open: FAIL ({type(exc).__name__}: {exc})",
-            ],
-        )
-        return False, report_path
+            ]
+        result = (getattr(model, "schema", "unknown"), *collect_pset_stats(model))
+
+    if cache_path is not None and not cached:
+        store_cached_stats(cache_path, cache_key, result)
 
-    stats_by_name, pset_count, assigned_ids, defined_ids = collect_pset_stats(model)
+    schema, stats_by_name, pset_count, unassigned_count = result
     lines = render_report(
         file_name=ifc_path.name,
-        schema=getattr(model, "schema", "unknown"),
+        schema=schema,
         stats_by_name=stats_by_name,
         pset_count=pset_count,
-        unassigned_count=len(defined_ids - assigned_ids),
+        unassigned_count=unassigned_count,
         max_properties=max_properties,
+        max_entity_types=max_entity_types,
+    )
+    return True, lines
+
+
+def build_report_for_file(
+    ifc_path: Path,
+    max_properties: int,
+    output_dir: Path,
+    engine: str = "ifcopenshell",
+    max_entity_types: int | None = None,
+    cache: bool = False,
+) -> tuple[bool, Path]:
+    report_path = output_dir / f"{ifc_path.stem}_PROPERTYSETS.txt"
+    success, lines = report_lines_for_file(
+        ifc_path, max_properties, engine, max_entity_types, cache_dir=output_dir if cache else None
     )
     write_report(report_path, lines)
-    return True, report_path
+    return success, report_path
+
+
+def render_report_for_file(
+    ifc_path: Path,
+    max_properties: int,
+    engine: str = "ifcopenshell",
+    max_entity_types: int | None = None,
+    cache_dir: Path | None = None,
+) -> tuple[bool, str]:
+    # Text for the shared --single-file report; a str also crosses the process boundary, unlike a generator.
+    success, lines = report_lines_for_file(ifc_path, max_properties, engine, max_entity_types, cache_dir)
+    return success, "".join(f"{line}\n" for line in lines)
 
 
 def parse_args() -> argparse.Namespace:
@@ -189,6 +627,38 @@ def parse_args() -> argparse.Namespace:
         default=30,
         help="Maksymalna liczba nazw property wypisywanych na jeden Property Set.",
     )
+    parser.add_argument(
+        "--max-entity-types",
+        type=int,
+        default=None,
+        help="Maksymalna liczba typow encji wypisywanych na jeden Property Set (domyslnie: wszystkie).",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Liczba procesow tworzacych raporty rownolegle (domyslnie: liczba rdzeni CPU).",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=("step", "ifcopenshell"),
+        default="ifcopenshell",
+        help="Sposob czytania plikow: pelne ifcopenshell.open lub szybkie skanowanie tekstu STEP (domyslnie: ifcopenshell).",
+    )
+    parser.add_argument(
+        "--single-file",
+        action="store_true",
+        help=f"Zapisz wszystkie raporty do jednego pliku {COMBINED_REPORT_NAME} w folderze wyjsciowym.",
+    )
+    parser.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help=(
+            "Zapisuj statystyki w plikach *.psetcache w folderze wyjsciowym i uzywaj ich ponownie, "
+            "dopoki rozmiar i czas modyfikacji pliku IFC sie nie zmienia (domyslnie: wylaczone)."
+        ),
+    )
     return parser.parse_args()
 
 
@@ -204,6 +674,13 @@ def main() -> int:
         print("Blad: --max-properties musi byc >= 1")
         return 2
 
+    if args.max_entity_types is not None and args.max_entity_types < 1:
+        print("Blad: --max-entity-types musi byc >= 1")
+        return 2
+    if args.jobs < 1:
+        print("Blad: --jobs musi byc >= 1")
+        return 2
+
     output_dir.mkdir(parents=True, exist_ok=True)
     ifc_files = find_ifc_files(search_dir, recursive=args.recursive)
     if not ifc_files:
@@ -215,15 +692,46 @@ def main() -> int:
     fail_count = 0
     reports: list[Path] = []
 
-    for ifc_path in ifc_files:
-        success, report_path = build_report_for_file(ifc_path, max_properties=args.max_properties, output_dir=output_dir)
-        reports.append(report_path)
-        if success:
-            ok_count += 1
-            print(f"OK: {ifc_path.name} -> {report_path.name}")
+    options = {
+        "max_properties": args.max_properties,
+        "engine": args.engine,
+        "max_entity_types": args.max_entity_types,
+    }
+    parallel = args.jobs > 1 and len(ifc_files) > 1
+    with ExitStack() as stack:
+        combined = None
+        if args.single_file:
+            # Workers return report text and only this process writes, so one open file serves every IFC.
+            combined_path = output_dir / COMBINED_REPORT_NAME
+            combined = stack.enter_context(combined_path.open("w", encoding="utf-8", buffering=REPORT_BUFFER_SIZE))
+            reports.append(combined_path)
+            task = functools.partial(
+                render_report_for_file, cache_dir=output_dir if args.cache else None, **options
+            )
+        else:
+            task = functools.partial(build_report_for_file, output_dir=output_dir, cache=args.cache, **options)
+
+        # Each worker opens its own IFC (ifcopenshell models must not be shared); map keeps file order.
+        if parallel:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=min(args.jobs, len(ifc_files))))
+            results = executor.map(task, ifc_files, chunksize=1)
         else:
-            fail_count += 1
-            print(f"FAIL: {ifc_path.name} -> {report_path.name}")
+            results = map(task, ifc_files)
+
+        for ifc_path, (success, outcome) in zip(ifc_files, results):
+            if combined is None:
+                report_path = outcome
+                reports.append(report_path)
+            else:
+                report_path = combined_path
+                combined.write(f"----- {ifc_path.name} -----\n")
+                combined.write(outcome)
+            if success:
+                ok_count += 1
+                print(f"OK: {ifc_path.name} -> {report_path.name}")
+            else:
+                fail_count += 1
+                print(f"FAIL: {ifc_path.name} -> {report_path.name}")
 
     print("\nPODSUMOWANIE")
     print(f"Pliki IFC: {len(ifc_files)}")